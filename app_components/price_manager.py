@@ -4,11 +4,33 @@ import pandas as pd
 from datetime import datetime, timedelta
 import pytz
 import time
+import shelve
+import threading
+from contextlib import contextmanager
+from pathlib import Path
 from curl_cffi import requests as curl_requests
 
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; fall back to unlocked access
+    fcntl = None
+
 # Import the mutual fund detection function
 from utils.portfolio_display import is_mutual_fund
 
+# How long fetched prices stay fresh while the market is open (seconds)
+_PRICE_CACHE_TTL = 300
+# How long past the TTL stale prices may be shown while a background refresh runs (seconds)
+_PRICE_CACHE_STALE_GRACE = 600
+
+# Disk cache keys with a background refresh in flight
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+# Disk cache so fetched prices survive Streamlit restarts and are shared between workers
+_DISK_CACHE_PATH = Path.home() / ".investment_calc_cache.db"
+_DISK_CACHE_MAX_AGE = timedelta(days=7)
+
 
 def _create_session():
     """Create a fresh curl_cffi session that mimics a browser."""
@@ -36,15 +58,70 @@ def is_market_open():
     return is_open, now_eastern
 
 
+def _last_close_date(market_time):
+    """
+    Return the date of the most recent market close (Eastern Time).
+    Weekends roll back to Friday; market holidays are not accounted for.
+    """
+    candidate = market_time.date()
+    if market_time.weekday() >= 5 or market_time.hour < 16:
+        candidate -= timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate -= timedelta(days=1)
+    return candidate
+
+
+@contextmanager
+def _disk_cache_lock(exclusive=False):
+    """Hold a file lock around disk cache access so concurrent workers don't corrupt it."""
+    lock_path = _DISK_CACHE_PATH.with_name(_DISK_CACHE_PATH.name + ".lock")
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _disk_get(key):
+    """Return the cached entry for key from the disk cache, or None if missing/unreadable."""
+    try:
+        with _disk_cache_lock():
+            with shelve.open(str(_DISK_CACHE_PATH), flag="r") as db:
+                return db.get(repr(key))
+    except Exception:
+        return None
+
+
+def _disk_put(key, payload, data_as_of=None):
+    """
+    Store payload in the disk cache, dropping entries older than a week.
+    data_as_of is the trading date of the most recent close contained in the payload.
+    """
+    now = datetime.now(pytz.utc)
+    try:
+        with _disk_cache_lock(exclusive=True):
+            with shelve.open(str(_DISK_CACHE_PATH)) as db:
+                for stale_key in [k for k, entry in db.items() if now - entry["fetched_at"] > _DISK_CACHE_MAX_AGE]:
+                    del db[stale_key]
+                db[repr(key)] = {"prices": payload, "fetched_at": now, "data_as_of": data_as_of}
+    except Exception:
+        # The disk cache is an optimization only; never fail a fetch because of it
+        pass
+
+
 def _get_ticker_tuple(portfolio):
     """Convert portfolio to a hashable tuple for caching."""
     return tuple((item["ticker"], item["quantity"]) for item in portfolio)
 
 
-def _fetch_with_retry(tickers, max_retries=3, initial_delay=3):
+def _fetch_with_retry(tickers, max_retries=3, initial_delay=3, verbose=True):
     """
     Fetch stock data with retry logic and rate limit handling.
     Uses yf.download with a fresh session each attempt.
+    Set verbose=False to suppress retry messages (e.g. outside the script thread).
     """
     ticker_list = list(tickers)
     delay = initial_delay
@@ -56,7 +133,8 @@ def _fetch_with_retry(tickers, max_retries=3, initial_delay=3):
             
             # Small delay before request to avoid triggering rate limits
             if attempt > 0:
-                st.info(f"Retry attempt {attempt + 1}/{max_retries}...")
+                if verbose:
+                    st.info(f"Retry attempt {attempt + 1}/{max_retries}...")
                 time.sleep(delay)
                 delay *= 2
             
@@ -72,7 +150,8 @@ def _fetch_with_retry(tickers, max_retries=3, initial_delay=3):
             # Check if we got actual data (not just empty structure)
             if hist_data.empty or len(hist_data) == 0:
                 if attempt < max_retries - 1:
-                    st.warning(f"No data returned, retrying in {delay} seconds...")
+                    if verbose:
+                        st.warning(f"No data returned, retrying in {delay} seconds...")
                     continue
                 return None, "No data returned after retries"
             
@@ -117,7 +196,8 @@ def _fetch_with_retry(tickers, max_retries=3, initial_delay=3):
                 return all_hist, None
             else:
                 if attempt < max_retries - 1:
-                    st.warning(f"Could not parse data, retrying...")
+                    if verbose:
+                        st.warning(f"Could not parse data, retrying...")
                     continue
                 return None, "Could not parse ticker data from response"
                 
@@ -125,7 +205,8 @@ def _fetch_with_retry(tickers, max_retries=3, initial_delay=3):
             error_msg = str(e)
             if "Too Many Requests" in error_msg or "Rate" in error_msg:
                 if attempt < max_retries - 1:
-                    st.warning(f"Rate limited, waiting {delay} seconds before retry...")
+                    if verbose:
+                        st.warning(f"Rate limited, waiting {delay} seconds before retry...")
                     time.sleep(delay)
                     delay *= 2
                     continue
@@ -134,7 +215,118 @@ def _fetch_with_retry(tickers, max_retries=3, initial_delay=3):
     return None, "Max retries exceeded"
 
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
+def _extract_prices(tickers, all_hist):
+    """
+    Derive current and previous-close prices from downloaded history.
+    Tickers without usable data get the default price.
+    Returns: (ticker_prices: dict, problems: dict of "missing"/"insufficient"/"errors" lists)
+    """
+    ticker_prices = {}
+    problems = {"missing": [], "insufficient": [], "errors": []}
+    
+    for ticker in tickers:
+        try:
+            if ticker not in all_hist or all_hist[ticker].empty:
+                problems["missing"].append(ticker)
+                ticker_prices[ticker] = 100.0
+                continue
+            
+            close_prices = all_hist[ticker]['Close'].dropna()
+            
+            if len(close_prices) < 2:
+                problems["insufficient"].append(ticker)
+                ticker_prices[ticker] = 100.0
+                continue
+            
+            # Special handling for mutual funds
+            if is_mutual_fund(ticker):
+                # For mutual funds, find the most recent two different prices
+                current_price = float(close_prices.iloc[-1])
+                
+                # Find the previous different price
+                prev_close = None
+                for i in range(2, min(len(close_prices) + 1, 6)):
+                    candidate = float(close_prices.iloc[-i])
+                    if abs(candidate - current_price) > 0.001:
+                        prev_close = candidate
+                        break
+                
+                if prev_close is None:
+                    prev_close = float(close_prices.iloc[-2])
+                
+                ticker_prices[ticker] = current_price
+                ticker_prices[f"{ticker}_previous_close"] = prev_close
+            else:
+                # Regular stocks - compare last two trading days
+                current_price = float(close_prices.iloc[-1])
+                prev_close = float(close_prices.iloc[-2])
+                
+                ticker_prices[ticker] = current_price
+                ticker_prices[f"{ticker}_previous_close"] = prev_close
+                
+        except Exception as e:
+            problems["errors"].append(f"{ticker} ({e})")
+            ticker_prices[ticker] = 100.0
+    
+    return ticker_prices, problems
+
+
+def _summarize_tickers(tickers, limit=10):
+    """Join ticker names for a message, truncating long lists."""
+    shown = ", ".join(tickers[:limit])
+    return f"{shown}..." if len(tickers) > limit else shown
+
+
+def _warn_price_problems(problems):
+    """Emit at most one warning per problem type instead of one per ticker."""
+    if problems["missing"]:
+        st.warning(f"No data for {len(problems['missing'])} tickers, using default price: "
+                   f"{_summarize_tickers(problems['missing'])}")
+    if problems["insufficient"]:
+        st.warning(f"Insufficient data for {len(problems['insufficient'])} tickers, using default price: "
+                   f"{_summarize_tickers(problems['insufficient'])}")
+    if problems["errors"]:
+        st.warning(f"Error processing {len(problems['errors'])} tickers, using default price: "
+                   f"{_summarize_tickers(problems['errors'])}")
+
+
+def _data_as_of(all_hist):
+    """Return the trading date the downloaded history is complete up to.
+
+    Uses the oldest of the per-ticker last closes, so a portfolio whose mutual fund
+    NAVs haven't posted yet isn't treated as already including the last close.
+    """
+    return min(hist.index[-1] for hist in all_hist.values()).date()
+
+
+def _refresh_in_background(tickers, disk_key):
+    """Start a background refresh of a disk cache entry, unless one is already running."""
+    with _refresh_lock:
+        if disk_key in _refreshing:
+            return
+        _refreshing.add(disk_key)
+    threading.Thread(target=_refresh_disk_cache, args=(tickers, disk_key), daemon=True).start()
+
+
+def _refresh_disk_cache(tickers, disk_key):
+    """Fetch fresh prices into the disk cache and drop the in-memory cache so the next render uses them."""
+    try:
+        all_hist, error = _fetch_with_retry(tickers, verbose=False)
+        if error or not all_hist:
+            return
+        ticker_prices, problems = _extract_prices(tickers, all_hist)
+        if not any(problems.values()):
+            _disk_put(disk_key, ticker_prices, _data_as_of(all_hist))
+            _fetch_stock_prices_cached.clear()
+    except Exception:
+        # Background refreshes are best effort; the next foreground fetch will retry
+        pass
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(disk_key)
+
+
+@st.cache_data(ttl=_PRICE_CACHE_TTL)  # Cache for 5 minutes
 def _fetch_stock_prices_cached(ticker_tuple, use_realtime_prices=False):
     """
     Get current stock prices for the portfolio.
@@ -160,71 +352,47 @@ def _fetch_stock_prices_cached(ticker_tuple, use_realtime_prices=False):
                 weekday = market_time.strftime('%A')
                 st.info(f"🔴 Market is CLOSED ({weekday}, {market_time.strftime('%I:%M %p')} ET) - Showing last trading day's change")
             
+            # Serve from the disk cache if it is still fresh. While the market is closed,
+            # data that already includes the last close can't change, so skip the download.
+            last_close_date = _last_close_date(market_time)
+            disk_key = (tuple(tickers), last_close_date)
+            cached = _disk_get(disk_key)
+            if cached is not None:
+                age = (datetime.now(pytz.utc) - cached["fetched_at"]).total_seconds()
+                has_last_close = cached.get("data_as_of") == last_close_date
+                if age < _PRICE_CACHE_TTL or (not market_is_open and has_last_close):
+                    st.success(f"Using cached market data ({len(tickers)} tickers)")
+                    return dict(cached["prices"])
+                if age < _PRICE_CACHE_TTL + _PRICE_CACHE_STALE_GRACE:
+                    # Stale-while-revalidate: show the recent prices now, refresh for the next render
+                    _refresh_in_background(tickers, disk_key)
+                    st.success(f"Using recently cached market data ({len(tickers)} tickers), refreshing in the background")
+                    return dict(cached["prices"])
+            
             # Fetch data with retry logic
             all_hist, error = _fetch_with_retry(tickers)
             
             if error:
                 st.error(f"Failed to fetch data: {error}")
                 st.info("Falling back to sample data")
-                for ticker in tickers:
-                    ticker_prices[ticker] = 100.0
-                return ticker_prices
+                return dict.fromkeys(tickers, 100.0)
             
             if not all_hist:
                 st.warning("No data returned from Yahoo Finance")
-                for ticker in tickers:
-                    ticker_prices[ticker] = 100.0
-                return ticker_prices
+                return dict.fromkeys(tickers, 100.0)
             
             # Process each ticker's data
-            for ticker in tickers:
-                try:
-                    if ticker not in all_hist or all_hist[ticker].empty:
-                        st.warning(f"No data for {ticker}, using default price")
-                        ticker_prices[ticker] = 100.0
-                        continue
-                    
-                    close_prices = all_hist[ticker]['Close'].dropna()
-                    
-                    if len(close_prices) < 2:
-                        st.warning(f"Insufficient data for {ticker}, using default price")
-                        ticker_prices[ticker] = 100.0
-                        continue
-                    
-                    # Special handling for mutual funds
-                    if is_mutual_fund(ticker):
-                        # For mutual funds, find the most recent two different prices
-                        current_price = float(close_prices.iloc[-1])
-                        
-                        # Find the previous different price
-                        prev_close = None
-                        for i in range(2, min(len(close_prices) + 1, 6)):
-                            candidate = float(close_prices.iloc[-i])
-                            if abs(candidate - current_price) > 0.001:
-                                prev_close = candidate
-                                break
-                        
-                        if prev_close is None:
-                            prev_close = float(close_prices.iloc[-2])
-                        
-                        ticker_prices[ticker] = current_price
-                        ticker_prices[f"{ticker}_previous_close"] = prev_close
-                    else:
-                        # Regular stocks - compare last two trading days
-                        current_price = float(close_prices.iloc[-1])
-                        prev_close = float(close_prices.iloc[-2])
-                        
-                        ticker_prices[ticker] = current_price
-                        ticker_prices[f"{ticker}_previous_close"] = prev_close
-                        
-                except Exception as e:
-                    st.warning(f"Error processing {ticker}: {e}, using default price")
-                    ticker_prices[ticker] = 100.0
+            extracted_prices, problems = _extract_prices(tickers, all_hist)
+            ticker_prices.update(extracted_prices)
+            _warn_price_problems(problems)
             
             # Only show success if we got real data
             real_prices = [p for t, p in ticker_prices.items() if '_previous_close' not in t and p != 100.0]
             if real_prices:
                 st.success(f"Using real-time market data ({len(real_prices)} tickers)")
+                # Only persist complete results so a partial fallback isn't served after a restart
+                if not any(problems.values()):
+                    _disk_put(disk_key, ticker_prices, _data_as_of(all_hist))
             else:
                 st.warning("Could not fetch any real-time data")
                 
@@ -235,8 +403,7 @@ def _fetch_stock_prices_cached(ticker_tuple, use_realtime_prices=False):
     
     # Use sample data if real-time prices are not available or not requested
     if not use_realtime_prices:
-        for ticker in tickers:
-            ticker_prices[ticker] = 100.0
+        ticker_prices.update(dict.fromkeys(tickers, 100.0))
         st.info("Using sample data (all prices set to $100.00)")
     
     return ticker_prices
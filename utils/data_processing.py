@@ -1,20 +1,85 @@
+import numpy as np
 import pandas as pd
-from decimal import Decimal, ROUND_DOWN
+import streamlit as st
 
 def calculate_current_distribution(portfolio, prices):
-    """Calculate current portfolio distribution"""
-    total_value = sum(item["quantity"] * prices[item["ticker"]] for item in portfolio)
+    """Calculate current portfolio distribution
     
-    distribution = {}
-    for item in portfolio:
-        ticker = item["ticker"]
-        value = item["quantity"] * prices[ticker]
-        distribution[ticker] = (value / total_value) * 100 if total_value > 0 else 0
+    Args:
+        portfolio: List of portfolio holdings
+        prices: Dictionary of ticker symbols to prices
+    """
+    tickers = [item["ticker"] for item in portfolio]
+    # Percentages are for display only, so single precision is plenty
+    quantities = np.fromiter((item["quantity"] for item in portfolio), dtype=np.float32, count=len(portfolio))
+    ticker_prices = np.fromiter((prices[ticker] for ticker in tickers), dtype=np.float32, count=len(tickers))
     
-    return distribution
+    return calculate_distribution_from_values(tickers, quantities * ticker_prices)
+
+def calculate_distribution_from_values(tickers, values):
+    """Calculate portfolio distribution from already computed holding values
+    
+    Args:
+        tickers: Sequence of ticker symbols
+        values: Array of market values aligned with tickers
+    """
+    # Accumulate in double precision so large portfolios don't drift
+    total_value = values.sum(dtype=np.float64)
+    
+    if total_value > 0:
+        percentages = values / total_value * 100
+    else:
+        percentages = [0] * len(tickers)
+    
+    return {ticker: float(pct) for ticker, pct in zip(tickers, percentages)}
+
+@st.cache_data(ttl=300)
+def _cached_distribution(portfolio_key, prices_key):
+    """Cached body of calculate_current_distribution_cached; keys are hashable tuples"""
+    portfolio = [{"ticker": ticker, "quantity": quantity} for ticker, quantity in portfolio_key]
+    return calculate_current_distribution(portfolio, dict(prices_key))
+
+def calculate_current_distribution_cached(portfolio, prices):
+    """Calculate current portfolio distribution, reusing the result across reruns
+    when the holdings and their prices are unchanged"""
+    portfolio_key = tuple((item["ticker"], item["quantity"]) for item in portfolio)
+    prices_key = tuple((ticker, prices[ticker]) for ticker, _ in portfolio_key)
+    return _cached_distribution(portfolio_key, prices_key)
+
+def _compute_trades(current_values, prices, target_pcts, whole_units, future_total_value):
+    """Compute the quantity and value change needed per ticker to reach its target
+    
+    All arguments except future_total_value are arrays aligned by ticker.
+    Returns (quantity_changes, value_changes); zero rows mean no trade.
+    """
+    value_differences = (target_pcts / 100) * future_total_value - current_values
+    raw_quantity_changes = value_differences / prices
+    
+    # Whole units: truncate, then add (buys) or remove (sells) one more unit
+    # when the fractional part is significant
+    whole_changes = np.trunc(raw_quantity_changes)
+    whole_changes += (raw_quantity_changes > 0) & (raw_quantity_changes - whole_changes > 0.5)
+    whole_changes -= (raw_quantity_changes < 0) & (whole_changes - raw_quantity_changes > 0.5)
+    
+    # Fractional shares: truncate to 2 decimal places
+    # (rounding first absorbs float noise such as 0.29 * 100 = 28.999...)
+    fractional_changes = np.trunc(np.round(raw_quantity_changes * 100, 6)) / 100
+    
+    quantity_changes = np.where(whole_units, whole_changes, fractional_changes)
+    # Differences under a cent need no trade
+    quantity_changes[np.abs(value_differences) < 0.01] = 0
+    
+    return quantity_changes, quantity_changes * prices
+
+# Columns of the optimize_trades result meant for display; the rest are numeric helpers
+RECOMMENDATION_DISPLAY_COLUMNS = ["Ticker", "Action", "Quantity", "Value"]
 
 def optimize_trades(portfolio, prices, target_distribution, available_funds, currency_symbol):
-    """Calculate optimal trades to reach target distribution"""
+    """Calculate optimal trades to reach target distribution
+    
+    Returns a DataFrame with the display columns in RECOMMENDATION_DISPLAY_COLUMNS
+    plus unsigned numeric Quantity_num and Value_num columns, or None if no trades are needed.
+    """
     # Calculate current portfolio value
     current_values = {item["ticker"]: item["quantity"] * prices[item["ticker"]] for item in portfolio}
     total_current_value = sum(current_values.values())
@@ -22,57 +87,53 @@ def optimize_trades(portfolio, prices, target_distribution, available_funds, cur
     # Calculate future portfolio value (current + new funds)
     future_total_value = total_current_value + available_funds
     
-    # Calculate target values for each ticker
-    target_values = {ticker: (pct/100) * future_total_value for ticker, pct in target_distribution.items()}
-    
-    # Initialize recommendation DataFrame
-    recommendations = []
-    
     # Create lookup for whole_units_only
     whole_units_lookup = {item["ticker"]: item["whole_units_only"] for item in portfolio}
     
-    # Calculate differences and needed trades
-    remaining_adjustment = Decimal('0.00')
+    # Align inputs by target ticker for the vectorized computation
+    tickers = list(target_distribution.keys())
+    quantity_changes, value_changes = _compute_trades(
+        np.array([current_values.get(ticker, 0) for ticker in tickers], dtype=np.float64),
+        np.array([prices[ticker] for ticker in tickers], dtype=np.float64),
+        np.array([target_distribution[ticker] for ticker in tickers], dtype=np.float64),
+        np.array([whole_units_lookup.get(ticker, False) for ticker in tickers], dtype=np.bool_),
+        float(future_total_value)
+    )
     
-    for ticker, target_value in target_values.items():
-        current_value = current_values.get(ticker, 0)
-        value_difference = target_value - current_value
-        
-        if abs(value_difference) < 0.01:
-            continue
-            
-        price = prices[ticker]
-        raw_quantity_change = value_difference / price
-        
-        # Handle whole unit restriction
-        if ticker in whole_units_lookup and whole_units_lookup[ticker]:
-            # Round to whole number
-            quantity_change = int(raw_quantity_change)
-            # If we're buying and the fractional part is significant, add one more unit
-            if raw_quantity_change > 0 and raw_quantity_change - quantity_change > 0.5:
-                quantity_change += 1
-            # If we're selling and the fractional part is significant, sell one more unit
-            elif raw_quantity_change < 0 and quantity_change - raw_quantity_change > 0.5:
-                quantity_change -= 1
-                
-            actual_value_change = quantity_change * price
-            adjustment = value_difference - actual_value_change
-            remaining_adjustment += Decimal(str(adjustment))
-        else:
-            # For fractional shares, round to 2 decimal places
-            quantity_change = Decimal(str(raw_quantity_change)).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
-            actual_value_change = float(quantity_change) * price
+    # Format only the tickers that need a trade
+    recommendations = []
+    for i in np.flatnonzero(quantity_changes):
+        ticker = tickers[i]
+        quantity_change = quantity_changes[i]
+        action = "Buy" if quantity_change > 0 else "Sell"
+        whole_units = whole_units_lookup.get(ticker)
         
-        if quantity_change != 0:
-            action = "Buy" if quantity_change > 0 else "Sell"
-            quantity_display = abs(quantity_change)
-            value_display = abs(actual_value_change)
-            
-            recommendations.append({
-                "Ticker": ticker,
-                "Action": action,
-                "Quantity": f"{quantity_display:.0f}" if ticker in whole_units_lookup and whole_units_lookup[ticker] else f"{quantity_display:.2f}",
-                "Value": f"{currency_symbol}{value_display:.2f}"
-            })
+        recommendations.append({
+            "Ticker": ticker,
+            "Action": action,
+            "Quantity": f"{abs(quantity_change):.0f}" if whole_units else f"{abs(quantity_change):.2f}",
+            "Value": f"{currency_symbol}{abs(value_changes[i]):.2f}",
+            # Numeric twins of the display columns, rounded exactly as displayed
+            # (builtin round on Python floats matches the string formatting)
+            "Quantity_num": round(abs(float(quantity_change)), 0 if whole_units else 2),
+            "Value_num": round(abs(float(value_changes[i])), 2)
+        })
     
     return pd.DataFrame(recommendations) if recommendations else None
+
+@st.cache_data(ttl="10m", max_entries=32)
+def _cached_optimize_trades(portfolio_key, prices_key, target_key, available_funds, currency_symbol):
+    """Cached body of optimize_trades_cached; keys are hashable tuples"""
+    portfolio = [{"ticker": ticker, "quantity": quantity, "whole_units_only": whole_units}
+                 for ticker, quantity, whole_units in portfolio_key]
+    return optimize_trades(portfolio, dict(prices_key), dict(target_key), available_funds, currency_symbol)
+
+def optimize_trades_cached(portfolio, prices, target_distribution, available_funds, currency_symbol):
+    """Calculate optimal trades to reach target distribution, reusing the result across
+    reruns when the holdings, prices, targets and funds are unchanged"""
+    portfolio_key = tuple((item["ticker"], item["quantity"], item["whole_units_only"]) for item in portfolio)
+    # Targets keep their order, since it sets the order of the recommendations
+    target_key = tuple(target_distribution.items())
+    tickers = dict.fromkeys([ticker for ticker, _, _ in portfolio_key] + list(target_distribution))
+    prices_key = tuple((ticker, prices[ticker]) for ticker in tickers)
+    return _cached_optimize_trades(portfolio_key, prices_key, target_key, available_funds, currency_symbol)
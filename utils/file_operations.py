@@ -2,10 +2,34 @@ import json
 import streamlit as st
 import os.path
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json module
+    orjson = None
+
+def parse_json(file):
+    """Parse JSON from a file-like object, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(file.read())
+    return json.load(file)
+
+@st.cache_data(max_entries=8)
+def _parse_json_bytes(raw_bytes):
+    """Parse JSON from raw bytes, cached per content so an upload is parsed once"""
+    if orjson is not None:
+        return orjson.loads(raw_bytes)
+    return json.loads(raw_bytes)
+
+def dump_json(data, indent=False):
+    """Serialize data to a JSON string, using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    return json.dumps(data, indent=2 if indent else None)
+
 def load_portfolio_from_json(file):
     """Load portfolio data from uploaded JSON file"""
     try:
-        return json.load(file)
+        return parse_json(file)
     except Exception as e:
         st.error(f"Error loading portfolio file: {e}")
         return None
@@ -13,17 +37,22 @@ def load_portfolio_from_json(file):
 def load_trade_plan_from_json(file):
     """Load trade plan data from uploaded JSON file"""
     try:
-        return json.load(file)
+        return _parse_json_bytes(file.getvalue())
     except Exception as e:
         st.error(f"Error loading trade plan file: {e}")
         return None
 
+@st.cache_data(ttl="5m", max_entries=8)
+def _load_json_file(filepath, mtime):
+    """Parse a JSON file, cached per path and modification time so edits are picked up"""
+    with open(filepath, 'rb') as file:
+        return parse_json(file)
+
 def load_file_if_exists(filepath):
     """Load data from a file if it exists"""
     if os.path.isfile(filepath):
         try:
-            with open(filepath, 'r') as file:
-                return json.load(file)
+            return _load_json_file(filepath, os.path.getmtime(filepath))
         except Exception as e:
             st.error(f"Error loading file {filepath}: {e}")
     return None
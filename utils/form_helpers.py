@@ -1,35 +1,38 @@
 import streamlit as st
 from .stock_data import fetch_stock_prices
+from .file_operations import parse_json, dump_json
 import pandas as pd
-import io
-import json
+import pyarrow as pa
 from typing import Tuple, Optional, Dict, Union, Any, List
 
+# Form-related session state variables and their initial values
+_FORM_STATE_DEFAULTS = (
+    ("form_ticker", ""),
+    ("form_price", None),
+    ("form_quantity", None),
+    ("form_whole_units", False),
+    ("real_time_price_fetched", False),
+    ("form_submitted", False),
+    ("show_add_another", False),
+    ("submitted_values", (None, None, None, False, False)),
+)
+
 def _initialize_session_state() -> None:
     """Initialize all form-related session state variables if they don't exist."""
-    if "form_ticker" not in st.session_state:
-        st.session_state.form_ticker = ""
-    if "form_price" not in st.session_state:
-        st.session_state.form_price = None
-    if "form_quantity" not in st.session_state:
-        st.session_state.form_quantity = None
-    if "form_whole_units" not in st.session_state:
-        st.session_state.form_whole_units = False
-    if "real_time_price_fetched" not in st.session_state:
-        st.session_state.real_time_price_fetched = False
-    if "form_submitted" not in st.session_state:
-        st.session_state.form_submitted = False
-    if "show_add_another" not in st.session_state:
-        st.session_state.show_add_another = False
-    if "submitted_values" not in st.session_state:
-        st.session_state.submitted_values = (None, None, None, False, False)
+    for key, default in _FORM_STATE_DEFAULTS:
+        st.session_state.setdefault(key, default)
+
+def _update_form_state(**values: Any) -> None:
+    """Write form state in a single update, skipping it when nothing changed."""
+    if any(st.session_state[key] != value for key, value in values.items()):
+        st.session_state.update(values)
 
 def _render_ticker_input() -> str:
     """Render the ticker symbol input field and return the entered ticker."""
     ticker_help = "Enter the stock symbol (e.g., AAPL for Apple Inc.)"
     ticker = st.text_input("Ticker Symbol", value=st.session_state.form_ticker, 
                         help=ticker_help).upper().strip()
-    st.session_state.form_ticker = ticker
+    _update_form_state(form_ticker=ticker)
     
     # Validate ticker format
     if ticker and not ticker.isalnum():
@@ -50,8 +53,8 @@ def _render_price_input(currency_symbol: str) -> float:
     
     # Update session state with manual price if entered
     if price and price != st.session_state.form_price:
-        st.session_state.form_price = price
-        st.session_state.real_time_price_fetched = False  # Reset fetched flag
+        # Reset fetched flag
+        _update_form_state(form_price=price, real_time_price_fetched=False)
     
     return price
 
@@ -70,8 +73,7 @@ def _fetch_realtime_price(ticker: str, currency_symbol: str) -> None:
                 real_price = fetch_stock_prices([ticker])
                 if real_price and ticker in real_price:
                     fetched_price = real_price[ticker]
-                    st.session_state.form_price = fetched_price
-                    st.session_state.real_time_price_fetched = True
+                    _update_form_state(form_price=fetched_price, real_time_price_fetched=True)
                     # Rerun the app to update the price field in the UI
                     st.rerun()
                 else:
@@ -89,24 +91,26 @@ def _render_quantity_input() -> float:
         placeholder="Enter quantity"
     )
     
-    if quantity and quantity != st.session_state.form_quantity:
-        st.session_state.form_quantity = quantity
+    if quantity:
+        _update_form_state(form_quantity=quantity)
     
     return quantity
 
 def _handle_form_submission(ticker: str, quantity: float, price: float, whole_units: bool) -> None:
     """Handle form submission and prepare for the add another prompt."""
-    # Store current values
-    st.session_state.submitted_values = (ticker, quantity, price, whole_units, True)
-    st.session_state.form_submitted = True
-    # Reset form fields
-    st.session_state.form_ticker = ""
-    st.session_state.form_price = None
-    st.session_state.form_quantity = None
-    st.session_state.form_whole_units = False
-    st.session_state.real_time_price_fetched = False
-    # Show the "Add another?" prompt
-    st.session_state.show_add_another = True
+    st.session_state.update(
+        # Store current values
+        submitted_values=(ticker, quantity, price, whole_units, True),
+        form_submitted=True,
+        # Reset form fields
+        form_ticker="",
+        form_price=None,
+        form_quantity=None,
+        form_whole_units=False,
+        real_time_price_fetched=False,
+        # Show the "Add another?" prompt
+        show_add_another=True,
+    )
     st.rerun()
 
 def _reset_submission_state() -> None:
@@ -197,8 +201,7 @@ def sequential_portfolio_form(use_realtime_prices: bool, currency_symbol: str) -
     
     with col2:
         whole_units = st.checkbox("Whole Units Only", value=st.session_state.form_whole_units)
-        if whole_units != st.session_state.form_whole_units:
-            st.session_state.form_whole_units = whole_units
+        _update_form_state(form_whole_units=whole_units)
     
     # Only proceed if we have a valid quantity
     if not st.session_state.form_quantity or st.session_state.form_quantity <= 0:
@@ -209,6 +212,33 @@ def sequential_portfolio_form(use_realtime_prices: bool, currency_symbol: str) -
     
     return ticker, quantity, st.session_state.form_price, whole_units, False
 
+# Example portfolio shown in the upload format explanation
+_EXAMPLE_PORTFOLIO_JSON = [
+    {"ticker": "AAPL", "quantity": 10, "price": 175.25, "whole_units_only": True},
+    {"ticker": "MSFT", "quantity": 5, "price": 320.50, "whole_units_only": True},
+    {"ticker": "GOOGL", "quantity": 2, "price": 2805.12, "whole_units_only": False},
+    {"ticker": "AMZN", "quantity": 3.5, "whole_units_only": False}  # No price - will use real-time
+]
+
+# Example portfolio table, kept in Arrow form so st.dataframe renders it without a pandas round trip
+_EXAMPLE_PORTFOLIO_TABLE = pa.Table.from_pydict({
+    "ticker": ["AAPL", "MSFT", "GOOGL", "AMZN"],
+    "quantity": [10, 5, 2, 3.5],
+    "price": [175.25, 320.50, 2805.12, None],  # Note: None for price to use real-time
+    "whole_units_only": [True, True, False, False]
+})
+
+def _build_csv_template() -> str:
+    """Serialize the example portfolio as a CSV template."""
+    # Replace None with empty string for CSV output
+    csv_df = _EXAMPLE_PORTFOLIO_TABLE.to_pandas()
+    csv_df['price'] = csv_df['price'].fillna('')
+    return csv_df.to_csv(index=False)
+
+# Downloadable templates are static, so serialize them once at import
+_CSV_TEMPLATE_BYTES = _build_csv_template().encode()
+_JSON_TEMPLATE_BYTES = dump_json(_EXAMPLE_PORTFOLIO_JSON, indent=True).encode()
+
 def explain_portfolio_upload_format() -> None:
     """
     Display explanation about the required format for portfolio uploads
@@ -227,60 +257,28 @@ def explain_portfolio_upload_format() -> None:
         format_tab1, format_tab2 = st.tabs(["CSV Format", "JSON Format"])
         
         with format_tab1:
-            # Create example CSV data
-            example_data = {
-                "ticker": ["AAPL", "MSFT", "GOOGL", "AMZN"],
-                "quantity": [10, 5, 2, 3.5],
-                "price": [175.25, 320.50, 2805.12, None],  # Note: None for price to use real-time
-                "whole_units_only": [True, True, False, False]
-            }
-            example_df = pd.DataFrame(example_data)
-            
             st.markdown("**CSV Example:**")
             # Display example as table
-            st.dataframe(example_df)
+            st.dataframe(_EXAMPLE_PORTFOLIO_TABLE)
             st.markdown("*Note: Empty price field for AMZN means real-time prices will be used if available*")
             
-            # Create downloadable CSV
-            # Replace None with empty string for CSV output
-            csv_df = example_df.copy()
-            csv_df['price'] = csv_df['price'].fillna('')
-            csv = csv_df.to_csv(index=False)
-            buffer = io.BytesIO()
-            buffer.write(csv.encode())
-            buffer.seek(0)
-            
             # Provide download button
             st.download_button(
                 label="Download CSV Template",
-                data=buffer,
+                data=_CSV_TEMPLATE_BYTES,
                 file_name="portfolio_template.csv",
                 mime="text/csv"
             )
         
         with format_tab2:
-            # Create example JSON data
-            example_json = [
-                {"ticker": "AAPL", "quantity": 10, "price": 175.25, "whole_units_only": True},
-                {"ticker": "MSFT", "quantity": 5, "price": 320.50, "whole_units_only": True},
-                {"ticker": "GOOGL", "quantity": 2, "price": 2805.12, "whole_units_only": False},
-                {"ticker": "AMZN", "quantity": 3.5, "whole_units_only": False}  # No price - will use real-time
-            ]
-            
             st.markdown("**JSON Example:**")
-            st.json(example_json)
+            st.json(_EXAMPLE_PORTFOLIO_JSON)
             st.markdown("*Note: No price field for AMZN means real-time prices will be used if available*")
             
-            # Create downloadable JSON
-            json_str = json.dumps(example_json, indent=2)
-            buffer = io.BytesIO()
-            buffer.write(json_str.encode())
-            buffer.seek(0)
-            
             # Provide download button
             st.download_button(
                 label="Download JSON Template",
-                data=buffer,
+                data=_JSON_TEMPLATE_BYTES,
                 file_name="portfolio_template.json",
                 mime="application/json"
             )
@@ -350,7 +348,7 @@ def handle_portfolio_file_upload() -> Optional[List[Dict[str, Any]]]:
         
         elif file_type == "JSON":
             # Process JSON file
-            portfolio_data = json.load(uploaded_file)
+            portfolio_data = parse_json(uploaded_file)
             
             # Validate the data structure
             if not isinstance(portfolio_data, list):
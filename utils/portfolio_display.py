@@ -1,27 +1,177 @@
+import re
+import hashlib
+from functools import lru_cache
+from types import SimpleNamespace
 import streamlit as st
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-from .data_processing import calculate_current_distribution
-from .visualization import plot_distribution
-from .file_operations import load_file_if_exists
+from .data_processing import calculate_distribution_from_values
+from .visualization import distribution_pie_png
 
+try:
+    import xxhash
+except ImportError:  # xxhash is optional; fall back to hashlib's blake2b
+    xxhash = None
+
+# Most mutual funds have X as the last letter or contain specific patterns
+_MF_RE = re.compile(r"VDIG|VFIN|VTHR|VGRO|VWEL|VPGD|VEXM|VWIN|VTWE|DODG|PIMCO|FXAI")
+
+@lru_cache(maxsize=1024)
 def is_mutual_fund(ticker):
     """Check if a ticker represents a mutual fund based on naming conventions."""
-    # Most mutual funds have X as the last letter or contain specific patterns
-    mutual_fund_patterns = ['VDIG', 'VFIN', 'VTHR', 'VGRO', 'VWEL', 'VPGD', 
-                           'VEXM', 'VWIN', 'VTWE', 'DODG', 'PIMCO', 'FXAI']
-    
-    # Check if ticker matches any mutual fund pattern
-    for pattern in mutual_fund_patterns:
-        if pattern in ticker:
-            return True
-    
-    # Check if ticker ends with X (common for mutual funds)
-    if ticker.endswith('X'):
-        return True
-        
-    return False
+    return ticker.endswith('X') or _MF_RE.search(ticker) is not None
+
+# Day change cell fragments: green up arrow / red down arrow, gray placeholders for pending NAV
+_UP_PREFIX = "<span style='color:green'>↑ "
+_DOWN_PREFIX = "<span style='color:red'>↓ "
+_SPAN_SUFFIX = "</span>"
+
+@lru_cache(maxsize=16)
+def _row_formatter(currency_symbol):
+    """Build cell formatters specialized for a currency symbol, reused across reruns"""
+    return SimpleNamespace(
+        money=(currency_symbol + "{:,.2f}").format,
+        money_up=(_UP_PREFIX + currency_symbol + "{:,.2f}" + _SPAN_SUFFIX).format,
+        money_down=(_DOWN_PREFIX + currency_symbol + "{:,.2f}" + _SPAN_SUFFIX).format,
+        pct_up=(_UP_PREFIX + "{:,.2f}%" + _SPAN_SUFFIX).format,
+        pct_down=(_DOWN_PREFIX + "{:,.2f}%" + _SPAN_SUFFIX).format,
+    )
+
+_NAV_PENDING_CHANGE = "<span style='color:gray'>NAV updates EOD</span>"
+_NAV_PENDING_DASH = "<span style='color:gray'>-</span>"
+
+def html_table(columns):
+    """Build an HTML table (laid out like DataFrame.to_html) from a dict of column lists, without escaping cells"""
+    header = "".join(f"<th>{name}</th>" for name in columns)
+    rows = "".join(
+        f"<tr><th>{i}</th>" + "".join(f"<td>{value}</td>" for value in row) + "</tr>"
+        for i, row in enumerate(zip(*columns.values()))
+    )
+    return (f"<table border=\"1\" class=\"dataframe\"><thead><tr style=\"text-align: right;\"><th></th>{header}</tr></thead>"
+            f"<tbody>{rows}</tbody></table>")
+
+def _compute_day_changes(quantities, prices, prev_closes, is_mf):
+    """Compute per-holding day change figures from row-aligned arrays
+    
+    prev_closes is NaN where no previous close is known. Mutual funds whose price
+    equals the previous close haven't published today's NAV yet (nav_pending).
+    
+    Returns:
+        (day_changes, day_change_percents, value_changes, has_prev_close, nav_pending, total_previous_value)
+    """
+    has_prev_close = ~np.isnan(prev_closes)
+    nav_pending = is_mf & (prices == prev_closes)
+    
+    # NaN propagates to the rows without a previous close
+    day_changes = prices - prev_closes
+    value_changes = day_changes * quantities
+    with np.errstate(divide='ignore', invalid='ignore'):
+        day_change_percents = np.where(has_prev_close & (prev_closes != 0), day_changes / prev_closes * 100, 0.0)
+    total_previous_value = float(np.nansum(quantities * prev_closes))
+    
+    return day_changes, day_change_percents, value_changes, has_prev_close, nav_pending, total_previous_value
+
+def _content_hash(*parts):
+    """Return a fast digest of the repr of parts, using xxhash when available"""
+    data = repr(parts).encode()
+    if xxhash is not None:
+        return xxhash.xxh64(data).intdigest()
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+def _day_change_columns(tickers, quantities, prices, ticker_prices, fmt):
+    """Build the Day Change, Day Change (%) and Value Change columns
+    
+    Returns:
+        (day_change_col, day_change_pct_col, value_change_col, total_previous_value)
+    """
+    # Nothing to compute when no previous closes came back at all (e.g. the price fetch failed)
+    if not any(key.endswith("_previous_close") for key in ticker_prices):
+        return ["N/A"] * len(tickers), ["N/A"] * len(tickers), ["N/A"] * len(tickers), 0
+    
+    # The ticker_prices dictionary must contain yesterday's closing prices
+    # with the key format "{ticker}_previous_close" when real-time pricing is enabled
+    # Look up each distinct ticker's previous close once, then align it with the rows
+    prev_close_lookup = {ticker: ticker_prices.get(f"{ticker}_previous_close", np.nan) for ticker in set(tickers)}
+    prev_closes = np.fromiter((prev_close_lookup[ticker] for ticker in tickers), dtype=np.float64, count=len(tickers))
+    is_mf = np.array([is_mutual_fund(ticker) for ticker in tickers], dtype=np.bool_)
+    
+    day_changes, day_change_percents, value_changes, has_prev_close, nav_pending, total_previous_value = \
+        _compute_day_changes(quantities, prices, prev_closes, is_mf)
+    
+    # Start every cell as N/A (no previous close), then fill pending NAVs and real changes by mask
+    day_change_col = np.full(len(tickers), "N/A", dtype=object)
+    day_change_pct_col = day_change_col.copy()
+    value_change_col = day_change_col.copy()
+    
+    day_change_col[nav_pending] = _NAV_PENDING_CHANGE
+    day_change_pct_col[nav_pending] = _NAV_PENDING_DASH
+    value_change_col[nav_pending] = _NAV_PENDING_DASH
+    
+    # Format with color and arrows
+    shown = np.flatnonzero(has_prev_close & ~nav_pending)
+    is_up = day_changes[shown] >= 0
+    money_formats = np.where(is_up, fmt.money_up, fmt.money_down)
+    pct_formats = np.where(is_up, fmt.pct_up, fmt.pct_down)
+    # Value change with color only if non-zero
+    value_formats = np.where(value_changes[shown] != 0, money_formats, fmt.money)
+    
+    day_change_col[shown] = [f(v) for f, v in zip(money_formats, np.abs(day_changes[shown]))]
+    day_change_pct_col[shown] = [f(v) for f, v in zip(pct_formats, np.abs(day_change_percents[shown]))]
+    value_change_col[shown] = [f(v) for f, v in zip(value_formats, np.abs(value_changes[shown]))]
+    
+    return day_change_col.tolist(), day_change_pct_col.tolist(), value_change_col.tolist(), total_previous_value
+
+def _build_holdings_summary(portfolio, ticker_prices, currency_symbol, use_real_time_pricing):
+    """Build the holdings table columns and portfolio totals
+    
+    Returns:
+        dict with "columns", "table_html" (real-time pricing only), "table_df" (otherwise), "distribution",
+        "total_value", "total_previous_value" and "total_annual_fee"
+    """
+    # Build numeric columns once, then format them in bulk
+    tickers = [item["ticker"] for item in portfolio]
+    quantities = np.array([item["quantity"] for item in portfolio], dtype=np.float64)
+    prices = np.array([ticker_prices.get(ticker, 100.00) for ticker in tickers], dtype=np.float64)
+    values = quantities * prices
+    total_value = float(values.sum())
+    
+    # Expense ratios (NaN where not available) and annual fee (expense ratio × value)
+    expense_ratios = np.array([np.nan if item.get("expense_ratio") is None else item["expense_ratio"]
+                               for item in portfolio], dtype=np.float64)
+    has_expense_ratio = ~np.isnan(expense_ratios)
+    annual_fees = values * (expense_ratios / 100)
+    total_annual_fee = float(np.nansum(annual_fees))
+    
+    fmt = _row_formatter(currency_symbol)
+    
+    portfolio_columns = {
+        "Ticker": tickers,
+        "Quantity": [item["quantity"] for item in portfolio],
+        "Price": [fmt.money(price) for price in prices],
+        "Value": [fmt.money(value) for value in values],
+        "Expense Ratio": [f"{er:.2f}%" if has else "N/A" for er, has in zip(expense_ratios, has_expense_ratio)],
+        "Annual Fee": [fmt.money(fee) if has else "N/A" for fee, has in zip(annual_fees, has_expense_ratio)],
+        "Type": ["Whole Units Only" if item["whole_units_only"] else "Fractional" for item in portfolio]
+    }
+    
+    total_previous_value = 0
+    
+    # Add day change columns if real-time pricing is enabled
+    if use_real_time_pricing:
+        (portfolio_columns["Day Change"], portfolio_columns["Day Change (%)"],
+         portfolio_columns["Value Change"], total_previous_value) = \
+            _day_change_columns(tickers, quantities, prices, ticker_prices, fmt)
+    
+    return {
+        "columns": portfolio_columns,
+        "table_html": html_table(portfolio_columns) if use_real_time_pricing else None,
+        "table_df": None if use_real_time_pricing else pd.DataFrame(portfolio_columns),
+        "distribution": calculate_distribution_from_values(tickers, values),
+        "total_value": total_value,
+        "total_previous_value": total_previous_value,
+        "total_annual_fee": total_annual_fee,
+    }
 
 def display_portfolio_summary(portfolio, ticker_prices, currency_symbol, use_real_time_pricing=False, funds_available=None):
     """Display portfolio summary and distribution
@@ -40,122 +190,34 @@ def display_portfolio_summary(portfolio, ticker_prices, currency_symbol, use_rea
     if funds_available is None:
         funds_available = st.session_state.get('funds_available', 0.0)
     
-    # Create and display portfolio table
-    portfolio_data = []
-    total_value = 0
-    total_previous_value = 0
-    total_annual_fee = 0
-    
-    for item in portfolio:
-        ticker = item["ticker"]
-        quantity = item["quantity"]
-        price = ticker_prices.get(ticker, 100.00)
-        value = quantity * price
-        total_value += value
-        
-        # Get expense ratio if available
-        expense_ratio = item.get("expense_ratio")
-        expense_ratio_display = f"{expense_ratio:.2f}%" if expense_ratio is not None else "N/A"
-        
-        # Calculate annual fee (expense ratio × value)
-        if expense_ratio is not None:
-            annual_fee = value * (expense_ratio / 100)
-            annual_fee_display = f"{currency_symbol}{annual_fee:,.2f}"
-            total_annual_fee += annual_fee
-        else:
-            annual_fee_display = "N/A"
-        
-        portfolio_item = {
-            "Ticker": ticker,
-            "Quantity": quantity,
-            "Price": f"{currency_symbol}{price:,.2f}",
-            "Value": f"{currency_symbol}{value:,.2f}",
-            "Expense Ratio": expense_ratio_display,
-            "Annual Fee": annual_fee_display,
-            "Type": "Whole Units Only" if item["whole_units_only"] else "Fractional"
-        }
-        
-        # Add day change columns if real-time pricing is enabled
-        if use_real_time_pricing:
-            # Get previous closing price from yesterday
-            # The ticker_prices dictionary must contain yesterday's closing prices
-            # with the key format "{ticker}_previous_close" when real-time pricing is enabled
-            prev_close = ticker_prices.get(f"{ticker}_previous_close")
-            
-            if prev_close is None:
-                # If previous closing price isn't available, show N/A for day change
-                portfolio_item["Day Change"] = "N/A"
-                portfolio_item["Day Change (%)"] = "N/A"
-                portfolio_item["Value Change"] = "N/A"
-            else:
-                # Special handling for mutual funds which update once per day
-                if is_mutual_fund(ticker):
-                    # Check if mutual fund price has been updated today
-                    if price == prev_close:
-                        portfolio_item["Day Change"] = f"<span style='color:gray'>NAV updates EOD</span>"
-                        portfolio_item["Day Change (%)"] = f"<span style='color:gray'>-</span>"
-                        portfolio_item["Value Change"] = f"<span style='color:gray'>-</span>"
-                        
-                        # Still add to previous value for total calculation
-                        total_previous_value += quantity * prev_close
-                    else:
-                        # Calculate day change if price has updated
-                        day_change = price - prev_close
-                        day_change_percent = (day_change / prev_close * 100) if prev_close != 0 else 0.0
-                        value_change = day_change * quantity
-                        
-                        # Calculate total previous value for portfolio day change
-                        total_previous_value += quantity * prev_close
-                        
-                        # Format with color and arrows
-                        day_change_color = "green" if day_change >= 0 else "red"
-                        day_change_arrow = "↑" if day_change >= 0 else "↓"
-                        
-                        portfolio_item["Day Change"] = f"<span style='color:{day_change_color}'>{day_change_arrow} {currency_symbol}{abs(day_change):,.2f}</span>"
-                        portfolio_item["Day Change (%)"] = f"<span style='color:{day_change_color}'>{day_change_arrow} {abs(day_change_percent):,.2f}%</span>"
-                        # Value change with color only if non-zero
-                        if value_change != 0:
-                            portfolio_item["Value Change"] = f"<span style='color:{day_change_color}'>{day_change_arrow} {currency_symbol}{abs(value_change):,.2f}</span>"
-                        else:
-                            portfolio_item["Value Change"] = f"{currency_symbol}0.00"
-                else:
-                    # Regular handling for stocks
-                    day_change = price - prev_close
-                    day_change_percent = (day_change / prev_close * 100) if prev_close != 0 else 0.0
-                    value_change = day_change * quantity
-                    
-                    # Calculate total previous value for portfolio day change
-                    total_previous_value += quantity * prev_close
-                    
-                    # Format with color and arrows
-                    day_change_color = "green" if day_change >= 0 else "red"
-                    day_change_arrow = "↑" if day_change >= 0 else "↓"
-                    
-                    portfolio_item["Day Change"] = f"<span style='color:{day_change_color}'>{day_change_arrow} {currency_symbol}{abs(day_change):,.2f}</span>"
-                    portfolio_item["Day Change (%)"] = f"<span style='color:{day_change_color}'>{day_change_arrow} {abs(day_change_percent):,.2f}%</span>"
-                    # Value change with color only if non-zero
-                    if value_change != 0:
-                        portfolio_item["Value Change"] = f"<span style='color:{day_change_color}'>{day_change_arrow} {currency_symbol}{abs(value_change):,.2f}</span>"
-                    else:
-                        portfolio_item["Value Change"] = f"{currency_symbol}0.00"
-        
-        portfolio_data.append(portfolio_item)
+    # Reuse the holdings table from the previous rerun when nothing it depends on has changed
+    summary_key = _content_hash(portfolio, sorted(ticker_prices.items()), currency_symbol, use_real_time_pricing)
+    if st.session_state.get("_summary_key") == summary_key:
+        summary = st.session_state["_summary"]
+    else:
+        summary = _build_holdings_summary(portfolio, ticker_prices, currency_symbol, use_real_time_pricing)
+        st.session_state["_summary_key"] = summary_key
+        st.session_state["_summary"] = summary
+    total_value = summary["total_value"]
+    total_previous_value = summary["total_previous_value"]
+    total_annual_fee = summary["total_annual_fee"]
     
     st.subheader("Current Holdings")
     
+    # Collect the headline figures and send them as a single markdown element
     # Display total portfolio value and funds available
     total_with_funds = total_value + funds_available
-    st.markdown(f"#### Total Portfolio Value: {currency_symbol}{total_value:,.2f}")
+    headlines = [f"#### Total Portfolio Value: {currency_symbol}{total_value:,.2f}"]
     
     # Display funds available to trade
     if funds_available > 0:
-        st.markdown(f"#### 💵 Funds Available to Trade: {currency_symbol}{funds_available:,.2f}")
-        st.markdown(f"#### 📊 Total (Portfolio + Funds): {currency_symbol}{total_with_funds:,.2f}")
+        headlines.append(f"#### 💵 Funds Available to Trade: {currency_symbol}{funds_available:,.2f}")
+        headlines.append(f"#### 📊 Total (Portfolio + Funds): {currency_symbol}{total_with_funds:,.2f}")
     
     # Display total annual fee and weighted average expense ratio
     if total_annual_fee > 0:
         weighted_avg_expense_ratio = (total_annual_fee / total_value * 100) if total_value > 0 else 0
-        st.markdown(f"#### Total Annual Fee: {currency_symbol}{total_annual_fee:,.2f} ({weighted_avg_expense_ratio:.2f}%)")
+        headlines.append(f"#### Total Annual Fee: {currency_symbol}{total_annual_fee:,.2f} ({weighted_avg_expense_ratio:.2f}%)")
     
     # If real-time pricing is enabled, display total day change
     if use_real_time_pricing and total_previous_value > 0:
@@ -165,20 +227,21 @@ def display_portfolio_summary(portfolio, ticker_prices, currency_symbol, use_rea
         day_change_color = "green" if total_day_change >= 0 else "red"
         day_change_arrow = "↑" if total_day_change >= 0 else "↓"
         
-        st.markdown(
+        headlines.append(
             f"#### Day Change: <span style='color:{day_change_color}'>{day_change_arrow} "
-            f"{currency_symbol}{abs(total_day_change):,.2f} ({abs(total_day_change_percent):,.2f}%)</span>", 
-            unsafe_allow_html=True
+            f"{currency_symbol}{abs(total_day_change):,.2f} ({abs(total_day_change_percent):,.2f}%)</span>"
         )
     
-    # Use st.write with unsafe_allow_html=True to render HTML in the table for colored arrows
+    st.markdown("\n\n".join(headlines), unsafe_allow_html=True)
+    
+    # Render the cells' HTML directly so the colored arrows show up
     if use_real_time_pricing:
-        st.write(pd.DataFrame(portfolio_data).to_html(escape=False), unsafe_allow_html=True)
+        st.markdown(summary["table_html"], unsafe_allow_html=True)
     else:
-        st.dataframe(pd.DataFrame(portfolio_data))
+        st.dataframe(summary["table_df"])
     
-    # Calculate and display distribution
-    distribution = calculate_current_distribution(portfolio, ticker_prices)
+    # Display distribution, computed from the holding values already in the summary
+    distribution = summary["distribution"]
     
     st.subheader("Current Distribution")
     col1, col2 = st.columns([2, 3])
@@ -186,8 +249,8 @@ def display_portfolio_summary(portfolio, ticker_prices, currency_symbol, use_rea
         # Display distribution as percentages
         dist_data = {"Ticker": list(distribution.keys()), 
                      "Percentage": [f"{val:.2f}%" for val in distribution.values()]}
-        st.dataframe(pd.DataFrame(dist_data))
+        st.table(dist_data)
     
     with col2:
         # Display distribution as pie chart
-        st.pyplot(plot_distribution(distribution))
+        st.image(distribution_pie_png(distribution), use_container_width=True)
@@ -1,105 +1,165 @@
 import streamlit as st
 import yfinance as yf
+import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional, Union
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 
-def fetch_stock_prices(tickers: List[str]) -> Dict[str, float]:
-    """Fetch real-time stock prices from Yahoo Finance"""
+# Upper bound on concurrent per-ticker Yahoo Finance lookups
+MAX_LOOKUP_WORKERS = 8
+
+def _fetch_one(ticker: str) -> Tuple[Optional[float], Optional[str], Optional[str]]:
+    """
+    Look up the latest price for a single ticker without touching the Streamlit UI,
+    so it can run on worker threads.
+    
+    Returns:
+        A tuple of (price, source, error) where source is "history", "market" or
+        "previous_close" and error is set if the lookup raised.
+    """
+    try:
+        ticker_obj: yf.Ticker = yf.Ticker(ticker)
+        
+        # Try to get the most recent price from history
+        history: pd.DataFrame = ticker_obj.history(period="1d")
+        if not history.empty and 'Close' in history.columns:
+            last_close: float = history['Close'].iloc[-1]
+            if not np.isnan(last_close):
+                return last_close, "history", None
+        
+        # Fallback to info property if history fails
+        if hasattr(ticker_obj, 'info'):
+            info: Dict[str, Union[float, str, int, None]] = ticker_obj.info
+            if 'regularMarketPrice' in info and info['regularMarketPrice'] is not None:
+                return info['regularMarketPrice'], "market", None
+            if 'previousClose' in info and info['previousClose'] is not None:
+                return info['previousClose'], "previous_close", None
+        
+        return None, None, None
+    except Exception as e:
+        return None, None, str(e)
+
+def _fetch_many(tickers: List[str]) -> Dict[str, Tuple[Optional[float], Optional[str], Optional[str]]]:
+    """Run _fetch_one for each ticker concurrently; lookups are network-bound"""
+    with ThreadPoolExecutor(max_workers=min(MAX_LOOKUP_WORKERS, len(tickers))) as executor:
+        return dict(zip(tickers, executor.map(_fetch_one, tickers)))
+
+# Prices are refetched at most once per bucket of this many seconds
+PRICE_CACHE_SECONDS = 300
+
+@st.cache_data(ttl=PRICE_CACHE_SECONDS, show_spinner=False)
+def _fetch_prices_cached(tickers: Tuple[str, ...], time_bucket: int) -> Dict[str, Tuple[Optional[float], Optional[str], Optional[str]]]:
+    """
+    Fetch prices for the tickers, cached per ticker set and time bucket.
+    
+    Returns:
+        A dict of ticker to (price, source, error) as from _fetch_one; tickers
+        priced by the batch download have source "batch".
+    """
+    # Single ticker approach first (more reliable for individual lookups)
+    if len(tickers) == 1:
+        return {tickers[0]: _fetch_one(tickers[0])}
+    
+    # Multiple tickers approach: first attempt batch download (fetched on yfinance's own threads)
+    data: pd.DataFrame = yf.download(" ".join(tickers), period="1d", progress=False, threads=True)
+    
+    # Take the latest close for every ticker in one pass over the Close block
+    last_closes: Dict[str, float] = {}
+    if not data.empty and isinstance(data.columns, pd.MultiIndex) and 'Close' in data.columns:
+        last_row = data['Close'].iloc[-1]
+        closes = last_row.to_numpy(dtype=np.float64)
+        found = ~np.isnan(closes)
+        last_closes = dict(zip(last_row.index[found], closes[found].tolist()))
+    
+    results: Dict[str, Tuple[Optional[float], Optional[str], Optional[str]]] = {
+        ticker: (last_closes[ticker], "batch", None) for ticker in tickers if ticker in last_closes
+    }
+    missing_tickers: List[str] = [ticker for ticker in tickers if ticker not in last_closes]
+    
+    # For any missing or NaN tickers, look them up individually in parallel
+    if missing_tickers:
+        results.update(_fetch_many(missing_tickers))
+    
+    return results
+
+def fetch_stock_prices(tickers: List[str], verbose: bool = False) -> Dict[str, float]:
+    """
+    Fetch real-time stock prices from Yahoo Finance
+    
+    Args:
+        tickers: Ticker symbols to look up
+        verbose: Report every individual lookup; by default individual lookups
+            are summarized in one message and only failures are listed
+    """
     if not tickers:
         return {}
     
+    # Look each ticker up once, keeping the callers' order for the status messages
+    tickers = list(dict.fromkeys(tickers))
+    
     ticker_prices: Dict[str, float] = {}
     with st.spinner('Fetching current market prices...'):
         try:
-            # Single ticker approach first (more reliable for individual lookups)
+            # Sorted so the same ticker set shares a cache entry whatever order it comes in
+            cache_key = (tuple(sorted(tickers)), int(time.time() // PRICE_CACHE_SECONDS))
+            results = _fetch_prices_cached(*cache_key)
+            if any(price is None for price, _, _ in results.values()):
+                # Don't hold on to failed lookups; the next call retries them
+                _fetch_prices_cached.clear(*cache_key)
+            
             if len(tickers) == 1:
                 ticker: str = tickers[0]
-                try:
-                    # Use direct Ticker object approach for single ticker
-                    ticker_obj: yf.Ticker = yf.Ticker(ticker)
-                    
-                    # Try to get the most recent price from history
-                    history: pd.DataFrame = ticker_obj.history(period="1d")
-                    if not history.empty and 'Close' in history.columns:
-                        last_close: float = history['Close'].iloc[-1]
-                        if not pd.isna(last_close):
-                            ticker_prices[ticker] = last_close
-                            st.success(f"Retrieved price for {ticker}: {last_close:.2f}")
-                            return ticker_prices
-                    
-                    # Fallback to info property if history fails
-                    if hasattr(ticker_obj, 'info'):
-                        info: Dict[str, Union[float, str, int, None]] = ticker_obj.info
-                        if 'regularMarketPrice' in info and info['regularMarketPrice'] is not None:
-                            ticker_prices[ticker] = info['regularMarketPrice']
-                            st.success(f"Retrieved market price for {ticker}: {info['regularMarketPrice']:.2f}")
-                            return ticker_prices
-                        if 'previousClose' in info and info['previousClose'] is not None:
-                            ticker_prices[ticker] = info['previousClose']
-                            st.success(f"Retrieved previous close for {ticker}: {info['previousClose']:.2f}")
-                            return ticker_prices
-                    
-                    st.warning(f"Could not retrieve price for {ticker} - verify the ticker symbol is correct")
-                    return {}
-                except Exception as e:
-                    st.error(f"Error fetching data for {ticker}: {str(e)}")
+                price, source, error = results[ticker]
+                
+                if error:
+                    st.error(f"Error fetching data for {ticker}: {error}")
                     return {}
-            
-            # Multiple tickers approach
-            else:
-                # First attempt batch download
-                ticker_string: str = " ".join(tickers)
-                data: pd.DataFrame = yf.download(ticker_string, period="1d", progress=False)
                 
-                missing_tickers: List[str] = []
+                if source == "history":
+                    st.success(f"Retrieved price for {ticker}: {price:.2f}")
+                elif source == "market":
+                    st.success(f"Retrieved market price for {ticker}: {price:.2f}")
+                elif source == "previous_close":
+                    st.success(f"Retrieved previous close for {ticker}: {price:.2f}")
+                else:
+                    st.warning(f"Could not retrieve price for {ticker} - verify the ticker symbol is correct")
+                    return {}
                 
-                # Process the data for multiple tickers
-                for ticker in tickers:
-                    try:
-                        # Check if ticker exists in data and has valid value
-                        if 'Close' in data.columns and isinstance(data.columns, pd.MultiIndex):
-                            if ticker in data['Close'].columns and not pd.isna(data['Close'][ticker].iloc[-1]):
-                                ticker_prices[ticker] = data['Close'][ticker].iloc[-1]
-                            else:
-                                missing_tickers.append(ticker)
-                        else:
-                            missing_tickers.append(ticker)
-                    except Exception:
-                        missing_tickers.append(ticker)
+                ticker_prices[ticker] = price
+                return ticker_prices
+            
+            missing_tickers: List[str] = [ticker for ticker in tickers if results[ticker][1] != "batch"]
+            ticker_prices.update((ticker, results[ticker][0]) for ticker in tickers if results[ticker][1] == "batch")
+            
+            if missing_tickers:
+                if verbose:
+                    st.info(f"Attempting individual lookup for {', '.join(missing_tickers)}...")
                 
-                # For any missing or NaN tickers, try individual lookup
                 for ticker in missing_tickers:
-                    try:
-                        # Try fetching individual ticker data
-                        st.info(f"Attempting individual lookup for {ticker}...")
-                        ticker_obj: yf.Ticker = yf.Ticker(ticker)
-                        
-                        # Try to get the most recent price from history
-                        history: pd.DataFrame = ticker_obj.history(period="1d")
-                        if not history.empty and 'Close' in history.columns:
-                            last_close: float = history['Close'].iloc[-1]
-                            if not pd.isna(last_close):
-                                ticker_prices[ticker] = last_close
-                                st.success(f"Retrieved price for {ticker} from historical data")
-                                continue
-                        
-                        # If that fails, try the info dictionary
-                        if hasattr(ticker_obj, 'info'):
-                            info: Dict[str, Union[float, str, int, None]] = ticker_obj.info
-                            if 'regularMarketPrice' in info and info['regularMarketPrice'] is not None:
-                                ticker_prices[ticker] = info['regularMarketPrice']
-                                st.success(f"Retrieved market price for {ticker}")
-                                continue
-                            if 'previousClose' in info and info['previousClose'] is not None:
-                                ticker_prices[ticker] = info['previousClose']
-                                st.success(f"Retrieved previous close for {ticker}")
-                                continue
-                        
+                    price, source, error = results[ticker]
+                    if error:
+                        st.warning(f"Error fetching individual data for {ticker}: {error}")
+                        continue
+                    
+                    if source is None:
                         st.warning(f"Could not retrieve price for {ticker} - verify the ticker symbol is correct")
-                    except Exception as e:
-                        st.warning(f"Error fetching individual data for {ticker}: {str(e)}")
+                        continue
+                    
+                    if verbose:
+                        if source == "history":
+                            st.success(f"Retrieved price for {ticker} from historical data")
+                        elif source == "market":
+                            st.success(f"Retrieved market price for {ticker}")
+                        elif source == "previous_close":
+                            st.success(f"Retrieved previous close for {ticker}")
+                    
+                    ticker_prices[ticker] = price
                 
-                return ticker_prices
+                if not verbose:
+                    st.success(f"Retrieved {len(ticker_prices)}/{len(tickers)} prices")
+            
+            return ticker_prices
         except Exception as e:
             st.error(f"Error fetching stock prices: {str(e)}")
             return {}
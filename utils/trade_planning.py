@@ -1,8 +1,8 @@
 import streamlit as st
-import pandas as pd
+import numpy as np
 
-from .data_processing import calculate_current_distribution, optimize_trades
-from .visualization import plot_distribution, create_sankey_chart
+from .data_processing import calculate_current_distribution_cached, optimize_trades_cached, RECOMMENDATION_DISPLAY_COLUMNS
+from .visualization import distribution_pie_png, create_sankey_chart, sankey_has_flow
 from .file_operations import load_file_if_exists, load_trade_plan_from_json
 
 def display_trade_planning(portfolio, ticker_prices, currency_symbol, funds_available=None):
@@ -49,23 +49,10 @@ def display_trade_planning(portfolio, ticker_prices, currency_symbol, funds_avai
         st.subheader("Target Distribution (%)")
         target_data = {"Ticker": list(target_distribution.keys()), 
                       "Target %": [f"{val:.2f}%" for val in target_distribution.values()]}
-        st.dataframe(pd.DataFrame(target_data))
+        st.table(target_data)
         
-        # Validate total is 100%
-        total_allocation = sum(target_distribution.values())
-        st.metric("Total Allocation", f"{total_allocation:.1f}%", 
-                 delta=f"{total_allocation - 100:.1f}%" if total_allocation != 100 else None)
-        
-        # Define threshold for what's considered "close" to 100%
-        threshold = 0.5  # ±0.5%
-        
-        if total_allocation != 100:
-            if abs(total_allocation - 100) <= threshold:
-                target_distribution = _adjust_allocation_to_100(target_distribution, total_allocation)
-                st.info(f"Allocation was {total_allocation:.2f}% and has been automatically adjusted to 100%. "
-                       f"This small correction ensures optimal trade calculations.")
-            else:
-                st.warning(f"Target allocation in {sample_trade_plan_path} sums to {total_allocation}%, not 100%")
+        target_distribution, total_allocation = _validate_total_allocation(
+            target_distribution, f"Target allocation in {sample_trade_plan_path} sums to {{total}}%, not 100%")
     else:
         # Use portfolio's funds_available as default, fallback to 1000.0 if not set
         default_funds = funds_available if funds_available > 0 else 1000.0
@@ -80,7 +67,7 @@ def display_trade_planning(portfolio, ticker_prices, currency_symbol, funds_avai
         st.subheader("Target Distribution (%)")
         
         # Calculate current distribution
-        distribution = calculate_current_distribution(portfolio, ticker_prices)
+        distribution = calculate_current_distribution_cached(portfolio, ticker_prices)
         
         # Create columns for target allocation input
         cols = st.columns(min(4, len(portfolio)))
@@ -98,21 +85,7 @@ def display_trade_planning(portfolio, ticker_prices, currency_symbol, funds_avai
                     key=f"target_{ticker}"
                 )
         
-        # Validate total is 100%
-        total_allocation = sum(target_distribution.values())
-        st.metric("Total Allocation", f"{total_allocation:.1f}%", 
-                    delta=f"{total_allocation - 100:.1f}%" if total_allocation != 100 else None)
-        
-        # Define threshold for what's considered "close" to 100%
-        threshold = 0.5  # ±0.5%
-        
-        if total_allocation != 100:
-            if abs(total_allocation - 100) <= threshold:
-                target_distribution = _adjust_allocation_to_100(target_distribution, total_allocation)
-                st.info(f"Allocation was {total_allocation:.2f}% and has been automatically adjusted to 100%. "
-                        f"This small correction ensures optimal trade calculations.")
-            else:
-                st.warning("Target allocation should sum to 100%")
+        target_distribution, total_allocation = _validate_total_allocation(target_distribution, "Target allocation should sum to 100%")
         
         with st.sidebar:
             plan_file = st.file_uploader("Upload trade plan JSON", type=["json"])
@@ -121,118 +94,157 @@ def display_trade_planning(portfolio, ticker_prices, currency_symbol, funds_avai
                 if plan_data:
                     available_funds = plan_data.get("available_funds", 0)
                     target_distribution = plan_data.get("target_allocation", {})
-                    
-                    # Validate total is 100%
-                    total_allocation = sum(target_distribution.values())
-                    st.metric("Total Allocation", f"{total_allocation:.1f}%", 
-                             delta=f"{total_allocation - 100:.1f}%" if total_allocation != 100 else None)
-                    
-                    # Define threshold for what's considered "close" to 100%
-                    threshold = 0.5  # ±0.5%
-                    
-                    if total_allocation != 100:
-                        if abs(total_allocation - 100) <= threshold:
-                            target_distribution = _adjust_allocation_to_100(target_distribution, total_allocation)
-                            st.info(f"Allocation was {total_allocation:.2f}% and has been automatically adjusted to 100%. "
-                                   f"This small correction ensures optimal trade calculations.")
-                        else:
-                            st.warning(f"Target allocation in JSON sums to {total_allocation}%, not 100%")
+                    target_distribution, total_allocation = _validate_total_allocation(
+                        target_distribution, "Target allocation in JSON sums to {total}%, not 100%")
     
     # Generate trade recommendations
     # Use a small tolerance for checking if allocation is 100%
     TOLERANCE = 0.1  # 0.1% tolerance for floating point precision
-    if target_distribution and abs(sum(target_distribution.values()) - 100) <= TOLERANCE:
+    if target_distribution and abs(total_allocation - 100) <= TOLERANCE:
         st.header("Trade Recommendations")
         
-        recommendations = optimize_trades(
-            portfolio, 
-            ticker_prices, 
-            target_distribution, 
-            available_funds,
-            currency_symbol
-        )
+        # The trade optimization and projected distribution are st.cache_data backed, so reruns are cheap
+        trade_plan = _build_trade_plan(portfolio, ticker_prices, target_distribution, available_funds, currency_symbol)
+        recommendations = trade_plan["recommendations"]
         
         if recommendations is not None and not recommendations.empty:
-            st.dataframe(recommendations)
+            st.dataframe(recommendations[RECOMMENDATION_DISPLAY_COLUMNS])
             
-            # Create Sankey chart to visualize the trade plan
-            try:
-                sankey_fig = create_sankey_chart(recommendations, available_funds, currency_symbol)
-                
-                if sankey_fig:
-                    st.subheader("Trade Plan Visualization")
-                    st.plotly_chart(sankey_fig, use_container_width=True)
-                else:
-                    st.info("Couldn't generate Sankey visualization based on current trades.")
-            except Exception as e:
-                st.warning(f"Unable to display Sankey diagram: {str(e)}")
+            # Create Sankey chart to visualize the trade plan (skipped when no money moves)
+            if sankey_has_flow(recommendations, available_funds):
+                try:
+                    sankey_fig = create_sankey_chart(recommendations, available_funds, currency_symbol)
+                    
+                    if sankey_fig:
+                        st.subheader("Trade Plan Visualization")
+                        st.plotly_chart(sankey_fig, use_container_width=True)
+                    else:
+                        st.info("Couldn't generate Sankey visualization based on current trades.")
+                except Exception as e:
+                    st.warning(f"Unable to display Sankey diagram: {str(e)}")
             
             # Calculate and display projected portfolio
             st.subheader("Projected Portfolio After Trades")
             
-            # Create a copy of the portfolio for projection
-            projected_portfolio = _calculate_projected_portfolio(portfolio, recommendations)
-            
-            # Calculate new distribution
-            projected_distribution = calculate_current_distribution(projected_portfolio, ticker_prices)
+            projected_portfolio = trade_plan["projected_portfolio"]
+            projected_distribution = trade_plan["projected_distribution"]
             
             # Show projected portfolio as table and chart
             col1, col2 = st.columns([2, 3])
             with col1:
-                tickers = list(projected_distribution.keys())
-                percentages = list(projected_distribution.values())
-                target_pcts = [target_distribution.get(ticker, 0) for ticker in tickers]
-                differences = [percentages[i] - target_pcts[i] for i in range(len(tickers))]
-                
-                proj_data = {
-                    "Ticker": tickers, 
-                    "Percentage": [f"{val:.2f}%" for val in percentages],
-                    "Target %": [f"{val:.2f}%" for val in target_pcts],
-                    "Diff from Target": [f"{val:+.2f}%" for val in differences]
-                }
-                st.dataframe(pd.DataFrame(proj_data))
+                st.table(trade_plan["projected_table"])
             
             with col2:
-                st.pyplot(plot_distribution(projected_distribution, "Projected Distribution"))
+                st.image(distribution_pie_png(projected_distribution, "Projected Distribution"), use_container_width=True)
             
             # Display expense ratio comparison
             _display_expense_ratio_comparison(portfolio, projected_portfolio, ticker_prices, currency_symbol)
         else:
             st.info("No trades needed to reach target allocation.")
 
+# Totals within this many percentage points of 100% are adjusted automatically
+_ALLOCATION_ADJUST_THRESHOLD = 0.5
+
+def _build_trade_plan(portfolio, ticker_prices, target_distribution, available_funds, currency_symbol):
+    """Compute the trade recommendations and the projected portfolio they lead to
+    
+    Returns:
+        dict with "recommendations" and, when there are trades, "projected_portfolio",
+        "projected_distribution" and "projected_table"
+    """
+    recommendations = optimize_trades_cached(
+        portfolio, 
+        ticker_prices, 
+        target_distribution, 
+        available_funds,
+        currency_symbol
+    )
+    if recommendations is None or recommendations.empty:
+        return {"recommendations": recommendations}
+    
+    # Create a copy of the portfolio for projection
+    projected_portfolio = _calculate_projected_portfolio(portfolio, _trade_quantity_changes(recommendations))
+    
+    # Calculate new distribution
+    projected_distribution = calculate_current_distribution_cached(projected_portfolio, ticker_prices)
+    
+    tickers = list(projected_distribution.keys())
+    percentages = list(projected_distribution.values())
+    target_pcts = [target_distribution.get(ticker, 0) for ticker in tickers]
+    differences = [percentages[i] - target_pcts[i] for i in range(len(tickers))]
+    
+    projected_table = {
+        "Ticker": tickers, 
+        "Percentage": [f"{val:.2f}%" for val in percentages],
+        "Target %": [f"{val:.2f}%" for val in target_pcts],
+        "Diff from Target": [f"{val:+.2f}%" for val in differences]
+    }
+    
+    return {
+        "recommendations": recommendations,
+        "projected_portfolio": projected_portfolio,
+        "projected_distribution": projected_distribution,
+        "projected_table": projected_table,
+    }
+
+def _validate_total_allocation(target_distribution, off_target_warning):
+    """Show the total allocation and adjust it to 100% when it is close enough
+    
+    Args:
+        target_distribution: Dictionary of ticker symbols to target percentages
+        off_target_warning: Warning shown when the total is too far from 100%;
+            "{total}" is replaced with the total allocation
+    
+    Returns:
+        (target_distribution, total_allocation) after any adjustment
+    """
+    total_allocation = sum(target_distribution.values())
+    st.metric("Total Allocation", f"{total_allocation:.1f}%", 
+             delta=f"{total_allocation - 100:.1f}%" if total_allocation != 100 else None)
+    
+    if total_allocation != 100:
+        if abs(total_allocation - 100) <= _ALLOCATION_ADJUST_THRESHOLD:
+            st.info(f"Allocation was {total_allocation:.2f}% and has been automatically adjusted to 100%. "
+                   f"This small correction ensures optimal trade calculations.")
+            target_distribution = _adjust_allocation_to_100(target_distribution, total_allocation)
+            total_allocation = sum(target_distribution.values())
+        else:
+            st.warning(off_target_warning.format(total=total_allocation))
+    
+    return target_distribution, total_allocation
+
 def _adjust_allocation_to_100(target_distribution, total_allocation):
     """Adjust allocation values proportionally to ensure they sum to 100%"""
     adjustment_factor = 100 / total_allocation
     
-    # Adjust each value proportionally
-    for ticker in target_distribution:
-        target_distribution[ticker] = round(target_distribution[ticker] * adjustment_factor, 2)
+    # Adjust each value proportionally into a new dict, leaving the input untouched
+    adjusted = {ticker: round(pct * adjustment_factor, 2) for ticker, pct in target_distribution.items()}
     
     # Ensure the sum is exactly 100% after rounding
-    adjusted_total = sum(target_distribution.values())
+    adjusted_total = sum(adjusted.values())
     if adjusted_total != 100:
         # Add/subtract the remaining tiny difference to/from the largest allocation
-        largest_ticker = max(target_distribution.items(), key=lambda x: x[1])[0]
-        target_distribution[largest_ticker] += (100 - adjusted_total)
+        largest_ticker = max(adjusted, key=adjusted.__getitem__)
+        adjusted[largest_ticker] += (100 - adjusted_total)
+    
+    return adjusted
+
+def _trade_quantity_changes(recommendations):
+    """Return the signed quantity change per ticker from the trade recommendations"""
+    if recommendations is None or recommendations.empty:
+        return {}
     
-    return target_distribution
+    # Tickers are unique per plan
+    quantities = recommendations["Quantity_num"].to_numpy()
+    signed_quantities = np.where(recommendations["Action"].eq("Sell"), -quantities, quantities)
+    return dict(zip(recommendations["Ticker"], signed_quantities.tolist()))
 
-def _calculate_projected_portfolio(portfolio, recommendations):
-    """Calculate the projected portfolio after applying the recommended trades"""
+def _calculate_projected_portfolio(portfolio, changes):
+    """Calculate the projected portfolio after applying the trades' per-ticker quantity changes"""
     projected_portfolio = []
     for item in portfolio:
         ticker = item["ticker"]
-        quantity = item["quantity"]
-        
-        # Find if there's a trade for this ticker
-        if recommendations is not None and not recommendations.empty:
-            for _, row in recommendations.iterrows():
-                if row["Ticker"] == ticker:
-                    quantity_str = row["Quantity"].replace(",", "")
-                    change = float(quantity_str)
-                    if row["Action"] == "Sell":
-                        change = -change
-                    quantity += change
+        quantity = item["quantity"] + changes.get(ticker, 0.0)
         
         if quantity > 0:
             projected_portfolio.append({
@@ -247,23 +259,17 @@ def _calculate_projected_portfolio(portfolio, recommendations):
 
 def _calculate_expense_metrics(portfolio, ticker_prices):
     """Calculate total value, total annual fee, and weighted average expense ratio"""
-    total_value = 0
-    total_annual_fee = 0
-    expense_ratios = {}
+    count = len(portfolio)
+    quantities = np.fromiter((item["quantity"] for item in portfolio), dtype=np.float64, count=count)
+    prices = np.fromiter((ticker_prices.get(item["ticker"], 100.00) for item in portfolio), dtype=np.float64, count=count)
+    expense_ratios = {item["ticker"]: item.get("expense_ratio") for item in portfolio}
+    # NaN where the expense ratio isn't known, so those holdings add no fee
+    ratios = np.fromiter((np.nan if item.get("expense_ratio") is None else item["expense_ratio"] for item in portfolio),
+                         dtype=np.float64, count=count)
     
-    for item in portfolio:
-        ticker = item["ticker"]
-        quantity = item["quantity"]
-        price = ticker_prices.get(ticker, 100.00)
-        value = quantity * price
-        total_value += value
-        
-        expense_ratio = item.get("expense_ratio")
-        expense_ratios[ticker] = expense_ratio
-        
-        if expense_ratio is not None:
-            annual_fee = value * (expense_ratio / 100)
-            total_annual_fee += annual_fee
+    values = quantities * prices
+    total_value = float(values.sum())
+    total_annual_fee = float(np.nansum(values * (ratios / 100)))
     
     weighted_avg_er = (total_annual_fee / total_value * 100) if total_value > 0 else 0
     
@@ -288,20 +294,14 @@ def _display_expense_ratio_comparison(current_portfolio, projected_portfolio, ti
     # Get all tickers from both portfolios
     all_tickers = set(current_expense_ratios.keys()) | set(projected_expense_ratios.keys())
     
-    comparison_data = []
-    for ticker in sorted(all_tickers):
-        current_er = current_expense_ratios.get(ticker)
-        projected_er = projected_expense_ratios.get(ticker)
-        
-        current_er_display = f"{current_er:.2f}%" if current_er is not None else "N/A"
-        projected_er_display = f"{projected_er:.2f}%" if projected_er is not None else "N/A"
-        
-        comparison_data.append({
-            "Ticker": ticker,
-            "Expense Ratio": current_er_display
-        })
+    tickers = sorted(all_tickers)
+    comparison_data = {
+        "Ticker": tickers,
+        "Expense Ratio": [f"{er:.2f}%" if er is not None else "N/A"
+                          for er in (current_expense_ratios.get(ticker) for ticker in tickers)]
+    }
     
-    st.dataframe(pd.DataFrame(comparison_data))
+    st.dataframe(comparison_data)
     
     # Total comparison
     st.markdown("#### Portfolio Fee Summary")
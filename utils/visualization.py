@@ -1,60 +1,91 @@
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
+import io
+import streamlit as st
+import numpy as np
+import pandas as pd
 
-def plot_distribution(distribution, title="Portfolio Distribution"):
-    """Create a pie chart of the distribution"""
-    fig, ax = plt.subplots(figsize=(8, 6))
+# matplotlib is slow to import, so it is loaded on first use
+_Figure = None
+
+def _get_figure_class():
+    """Return matplotlib.figure.Figure, importing it on first use"""
+    global _Figure
+    if _Figure is None:
+        from matplotlib.figure import Figure
+        _Figure = Figure
+    return _Figure
+
+@st.cache_data(ttl=600)
+def _cached_pie_png(dist_items, title):
+    """Render the distribution pie chart to PNG bytes, cached per distribution and title
+    
+    The figure is created outside pyplot, so it isn't tracked by pyplot's global
+    figure manager and is freed once rendered; nothing needs closing.
+    """
+    fig = _get_figure_class()(figsize=(8, 6))
+    ax = fig.subplots()
     ax.pie(
-        distribution.values(),
-        labels=distribution.keys(),
+        [value for _, value in dist_items],
+        labels=[ticker for ticker, _ in dist_items],
         autopct='%1.1f%%',
         startangle=90
     )
     ax.axis('equal')
-    plt.title(title)
-    return fig
+    ax.set_title(title)
+    
+    buffer = io.BytesIO()
+    # Match st.pyplot's rendering defaults
+    fig.savefig(buffer, format="png", bbox_inches="tight", dpi=200)
+    return buffer.getvalue()
+
+def distribution_pie_png(distribution, title="Portfolio Distribution"):
+    """Return the pie chart of the distribution as PNG bytes, reusing unchanged charts across reruns"""
+    return _cached_pie_png(tuple(distribution.items()), title)
+
+def sankey_has_flow(recommendations, available_funds):
+    """Return whether the trade plan moves any money; with no funds and nothing sold there is no flow to show"""
+    return available_funds > 0 or bool(recommendations["Action"].eq("Sell").any())
 
 def create_sankey_chart(recommendations, available_funds, currency_symbol):
     """Create a Sankey diagram to visualize the flow of funds in the trade plan"""
     if recommendations is None or recommendations.empty:
         return None
     
+    if not sankey_has_flow(recommendations, available_funds):
+        return None
+    
+    records = tuple(recommendations[["Ticker", "Action", "Value_num"]].itertuples(index=False, name=None))
+    return _cached_sankey_chart(records, available_funds)
+
+@st.cache_resource(ttl="10m", max_entries=16)
+def _cached_sankey_chart(records, available_funds):
+    """Build the Sankey figure from (ticker, action, numeric value) records, shared across reruns
+    
+    Callers must not modify the returned figure.
+    """
+    import plotly.graph_objects as go
+    
+    tickers, actions, trade_values = (np.array(column) for column in zip(*records))
+    
     # Prepare data for Sankey diagram
     labels = ["Available Funds"]
-    source = []
-    target = []
-    value = []
-    colors = []
-    
-    # Add all unique tickers from recommendations
-    tickers = recommendations["Ticker"].unique()
-    labels.extend(tickers)
     
-    # Dictionary to map ticker names to their index in labels
-    ticker_indices = {ticker: i+1 for i, ticker in enumerate(tickers)}
+    # Add all unique tickers from recommendations, in order of first appearance;
+    # each row's node index is its ticker's code + 1 (index 0 is Available Funds)
+    codes, unique_tickers = pd.factorize(tickers)
+    labels.extend(unique_tickers.tolist())
+    ticker_idx = codes + 1
     
-    # Process each recommendation
-    buys_total = 0
-    for _, row in recommendations.iterrows():
-        ticker = row["Ticker"]
-        action = row["Action"]
-        # Extract numeric value from the Value column
-        value_str = row["Value"].replace(currency_symbol, "").replace(",", "")
-        trade_value = float(value_str)
-        
-        if action == "Buy":
-            # From Available Funds to the ticker
-            source.append(0)  # Available Funds index
-            target.append(ticker_indices[ticker])
-            value.append(trade_value)
-            colors.append("rgba(44, 160, 44, 0.8)")  # Green for buys
-            buys_total += trade_value
-        elif action == "Sell":
-            # From the ticker to Available Funds (or to be redistributed)
-            source.append(ticker_indices[ticker])
-            target.append(0)  # Back to Available Funds
-            value.append(trade_value)
-            colors.append("rgba(214, 39, 40, 0.8)")  # Red for sells
+    # Buys flow from Available Funds to the ticker, sells from the ticker back to Available Funds;
+    # rows with any other action are left out
+    is_buy = actions == "Buy"
+    shown = is_buy | (actions == "Sell")
+    shown_buys = is_buy[shown]
+    source = np.where(shown_buys, 0, ticker_idx[shown]).tolist()
+    target = np.where(shown_buys, ticker_idx[shown], 0).tolist()
+    value = trade_values[shown].tolist()
+    # Green for buys, red for sells
+    colors = np.where(shown_buys, "rgba(44, 160, 44, 0.8)", "rgba(214, 39, 40, 0.8)").tolist()
+    buys_total = sum(trade_values[is_buy].tolist())
     
     # Add remaining available funds flow if there are buys
     if buys_total > 0 and buys_total < available_funds:
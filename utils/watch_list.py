@@ -1,12 +1,38 @@
 import streamlit as st
 import pandas as pd
+from pyarrow import csv as pacsv
+import pyarrow.parquet as pq
 import json
 import os
 from datetime import datetime
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
 import numpy as np
 from .stock_data import fetch_stock_prices
+from .file_operations import parse_json
+
+def _change_color(change):
+    """Cell style for a price change: green when up, red when down, none when missing"""
+    if pd.isna(change):
+        return ''
+    return 'color: green' if change >= 0 else 'color: red'
+
+def _style_watch_list(table, currency_symbol):
+    """Format the numeric watch list table for display, with colored arrows on the changes"""
+    def arrow(template):
+        return lambda change: ('↑ ' if change >= 0 else '↓ ') + template.format(abs(change))
+    
+    money = f"{currency_symbol}{{:.2f}}"
+    formatters = {name: money for name in ('Previous Price', 'Previous Value', 'Current Price', 'Current Value')}
+    formatters.update({'Change': arrow(money), 'Change %': arrow("{:.2f}%")})
+    return table.style.format(formatters, na_rep='N/A').map(_change_color, subset=['Change', 'Change %'])
+
+# Supported watch list file types
+WATCH_LIST_EXTENSIONS = ('.json', '.csv', '.parquet')
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _list_watch_lists(dirpath):
+    """List the watch list files in a directory; cleared whenever a watch list is saved"""
+    return [entry.name for entry in os.scandir(dirpath)
+            if entry.is_file() and entry.name.endswith(WATCH_LIST_EXTENSIONS)]
 
 def show_watch_list_tab(ticker_prices, use_realtime_prices, currency_symbol):
     """Display the watch list tab with all functionality"""
@@ -19,7 +45,7 @@ def show_watch_list_tab(ticker_prices, use_realtime_prices, currency_symbol):
         st.info(f"Created watch lists directory at {watch_list_dir}")
     
     # Get available watch lists
-    watch_list_files = [f for f in os.listdir(watch_list_dir) if f.endswith(('.json', '.csv'))]
+    watch_list_files = _list_watch_lists(watch_list_dir)
     
     if not watch_list_files:
         st.info("No watch lists found. Upload a watch list file or use the sample.")
@@ -27,11 +53,12 @@ def show_watch_list_tab(ticker_prices, use_realtime_prices, currency_symbol):
         # Create sample watch list file button
         if st.button("Create Sample Watch List"):
             create_sample_watch_list(watch_list_dir)
+            _list_watch_lists.clear()
             st.success("Sample watch list created!")
             st.rerun()
     
     # Upload new watch list
-    uploaded_watch_list = st.file_uploader("Upload a new watch list file", type=["json", "csv"])
+    uploaded_watch_list = st.file_uploader("Upload a new watch list file", type=[extension.lstrip('.') for extension in WATCH_LIST_EXTENSIONS])
     
     # Add formatting help expander
     with st.expander("Read about correct file formatting"):
@@ -75,6 +102,10 @@ def show_watch_list_tab(ticker_prices, use_realtime_prices, currency_symbol):
         MSFT,2022-01-01,308.26,1
         GOOGL,2022-01-01,2667.02,0.5
         ```
+        
+        ### Parquet Format
+        A Parquet file with the same columns as the CSV format, or with a `historical_data`
+        list column shaped like the JSON format. Parquet loads fastest for large watch lists.
         """)
     
     if uploaded_watch_list:
@@ -84,153 +115,147 @@ def show_watch_list_tab(ticker_prices, use_realtime_prices, currency_symbol):
         if st.button("Save Watch List"):
             with open(os.path.join(watch_list_dir, f"{watch_list_name}.{file_extension}"), "wb") as f:
                 f.write(uploaded_watch_list.getbuffer())
+            _list_watch_lists.clear()
             st.success(f"Watch list '{watch_list_name}' saved successfully!")
             st.rerun()
     
-    # Refresh watch list files
-    watch_list_files = [f for f in os.listdir(watch_list_dir) if f.endswith(('.json', '.csv'))]
-    
     if watch_list_files:
+        # Fetch prices for every watch list in one call; unreadable files report their error in their tab
+        file_paths = [os.path.join(watch_list_dir, f) for f in watch_list_files]
+        current_prices = None
+        if use_realtime_prices:
+            all_tickers = set()
+            for file_path in file_paths:
+                try:
+                    all_tickers.update(item['ticker'] for item in _load_watch_list(file_path, os.stat(file_path).st_mtime_ns)
+                                       if item.get('ticker'))
+                except Exception:
+                    continue
+            current_prices = fetch_stock_prices(sorted(all_tickers))
+        
         # Create tabs for each watch list
-        watch_list_tabs = st.tabs([f.split('.')[0] for f in watch_list_files])
+        watch_list_tabs = st.tabs([os.path.splitext(f)[0] for f in watch_list_files])
         
-        for i, tab in enumerate(watch_list_tabs):
+        for tab, file_path in zip(watch_list_tabs, file_paths):
             with tab:
-                file_path = os.path.join(watch_list_dir, watch_list_files[i])
-                display_watch_list(file_path, ticker_prices, use_realtime_prices, currency_symbol)
+                display_watch_list(file_path, ticker_prices, use_realtime_prices, currency_symbol, current_prices)
 
-def display_watch_list(file_path, ticker_prices, use_realtime_prices, currency_symbol):
-    """Display watch list data with historical values and current prices"""
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_watch_list(file_path, mtime_ns):
+    """Parse a watch list file into a list of dicts, cached per path and modification time"""
+    if file_path.split('.')[-1].lower() == 'json':
+        with open(file_path, 'rb') as f:
+            return parse_json(f)
+    if file_path.split('.')[-1].lower() == 'parquet':
+        records = pq.read_table(file_path).to_pylist()
+        # Date-typed columns come back as date objects; keep them ISO strings like the JSON format
+        for item in records:
+            for point in item.get('historical_data') or []:
+                if hasattr(point.get('date'), 'isoformat'):
+                    point['date'] = point['date'].isoformat()
+        return records
+    return pacsv.read_csv(file_path).to_pylist()
+
+def display_watch_list(file_path, ticker_prices, use_realtime_prices, currency_symbol, current_prices=None):
+    """Display watch list data with historical values and current prices
+    
+    current_prices may hold real-time prices already fetched by the caller;
+    otherwise they are fetched here when use_realtime_prices is set.
+    """
     file_extension = file_path.split('.')[-1].lower()
     
     try:
-        if file_extension == 'json':
-            with open(file_path, 'r') as f:
-                watch_list_data = json.load(f)
-        elif file_extension == 'csv':
-            watch_list_data = pd.read_csv(file_path).to_dict('records')
-        else:
+        if f".{file_extension}" not in WATCH_LIST_EXTENSIONS:
             st.error(f"Unsupported file format: {file_extension}")
             return
         
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        # Skip rows without a ticker (e.g. blank CSV lines)
+        watch_list_data = [item for item in _load_watch_list(file_path, mtime_ns) if item.get('ticker')]
+        
         # Extract tickers from watch list
         tickers = [item['ticker'] for item in watch_list_data]
         
+        if not tickers:
+            st.info("No data in this watch list.")
+            return
+        
         # Fetch current prices if enabled
         if use_realtime_prices:
-            current_prices = fetch_stock_prices(tickers)
+            if current_prices is None:
+                current_prices = fetch_stock_prices(tickers)
             if not current_prices:
                 st.warning("Could not fetch current prices. Using latest recorded values.")
                 current_prices = {}
         else:
             current_prices = {}
         
-        # Prepare watch list table
-        watch_list_table = []
+        # First (and should be only) historical data point per ticker, None if there is none
+        points = [(item.get('historical_data') or [None])[0] for item in watch_list_data]
         
-        for item in watch_list_data:
-            ticker = item['ticker']
-            historical_data = item.get('historical_data', [])
-            
-            if historical_data:
-                # Get the first (and should be only) historical data point
-                historical_point = historical_data[0]
-                historical_price = float(historical_point['price'])
-                historical_value = float(historical_point['value'])
-                historical_date = historical_point['date']
-                
-                # Get current price if available
-                current_price = current_prices.get(ticker, ticker_prices.get(ticker, historical_price))
-                
-                # Calculate number of units and current value
-                units = historical_value / historical_price if historical_price else 0
-                current_value = current_price * units
-                
-                # Calculate change based on price
-                absolute_change = current_price - historical_price
-                percent_change = (absolute_change / historical_price) * 100 if historical_price else 0
-                
-                # Color code and add arrows based on change direction
-                change_color = "green" if absolute_change >= 0 else "red"
-                change_arrow = "↑" if absolute_change >= 0 else "↓"
-                
-                watch_list_table.append({
-                    'Ticker': ticker,
-                    'Previous Date': historical_date,
-                    'Previous Price': f"{currency_symbol}{historical_price:.2f}",
-                    'Previous Value': f"{currency_symbol}{historical_value:.2f}",
-                    'Current Price': f"{currency_symbol}{current_price:.2f}",
-                    'Current Value': f"{currency_symbol}{current_value:.2f}",
-                    'Change': f"<span style='color:{change_color}'>{change_arrow} {currency_symbol}{abs(absolute_change):.2f}</span>",
-                    'Change %': f"<span style='color:{change_color}'>{change_arrow} {abs(percent_change):.2f}%</span>"
-                })
-                
-                # Plot historical data
-                if st.checkbox(f"Show historical data for {ticker}", key=f"hist_{ticker}"):
-                    plot_historical_data(ticker, historical_point, current_price, currency_symbol)
-            else:
-                # No historical data, just show current price
-                current_price = current_prices.get(ticker, ticker_prices.get(ticker, 0))
-                watch_list_table.append({
-                    'Ticker': ticker,
-                    'Previous Date': 'N/A',
-                    'Previous Price': 'N/A',
-                    'Previous Value': 'N/A',
-                    'Current Price': f"{currency_symbol}{current_price:.2f}",
-                    'Current Value': 'N/A',
-                    'Change': 'N/A',
-                    'Change %': 'N/A'
-                })
-        
-        # Display watch list table
-        if watch_list_table:
-            df = pd.DataFrame(watch_list_table)
-            st.write(df.to_html(escape=False), unsafe_allow_html=True)
+        # Reuse the table from the previous rerun while the file and its prices are unchanged
+        # Real-time prices override the sidebar prices
+        prices = {**ticker_prices, **current_prices}
+        table_key = (mtime_ns, tuple((ticker, prices.get(ticker)) for ticker in tickers))
+        cached_tables = st.session_state.setdefault("_watch_list_tables", {})
+        if file_path in cached_tables and cached_tables[file_path][0] == table_key:
+            table = cached_tables[file_path][1]
         else:
-            st.info("No data in this watch list.")
+            table = _build_watch_list_table(tickers, points, prices)
+            cached_tables[file_path] = (table_key, table)
+        
+        # Plot historical data
+        for ticker, point, price in zip(tickers, points, table['Current Price']):
+            if point and st.checkbox(f"Show historical data for {ticker}", key=f"hist_{ticker}"):
+                plot_historical_data(ticker, point, float(price), currency_symbol)
+        
+        # Display watch list table; values stay numeric and are only formatted for display
+        st.dataframe(_style_watch_list(table, currency_symbol), hide_index=True)
     
     except Exception as e:
         st.error(f"Error loading watch list: {str(e)}")
 
-def plot_historical_data(ticker, historical_point, current_price, currency_symbol):
-    """Plot historical price data compared to current price"""
-    # Create simple two-point plot
-    historical_date = datetime.strptime(historical_point['date'], '%Y-%m-%d')
-    historical_price = float(historical_point['price'])  # Changed from 'value' to 'price'
-    today = datetime.now()
-    
-    # Create DataFrame with two points
-    df = pd.DataFrame([
-        {'date': historical_date, 'price': historical_price},  # Changed from 'value' to 'price'
-        {'date': today, 'price': current_price}  # Changed from 'value' to 'price'
-    ])
-    
-    # Create plot
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(df['date'], df['price'], marker='o', linestyle='-')  # Changed from 'value' to 'price'
-    
-    # Add title and labels
-    ax.set_title(f"{ticker} Price Comparison")
-    ax.set_xlabel("Date")
-    ax.set_ylabel(f"Price ({currency_symbol})")
+def _build_watch_list_table(tickers, points, prices):
+    """Compute the numeric watch list table; rows without a historical point show N/A"""
+    has_history = np.array([point is not None for point in points], dtype=bool)
+    historical_prices = np.array([float(point['price']) if point else np.nan for point in points])
+    historical_values = np.array([float(point['value']) if point else np.nan for point in points])
     
-    # Format dates
-    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-    plt.xticks(rotation=45)
+    # Current price falls back to the recorded price (0 without history)
+    fallback_prices = np.where(has_history, historical_prices, 0)
+    current = np.array([prices.get(ticker, fallback)
+                        for ticker, fallback in zip(tickers, fallback_prices)], dtype=np.float64)
     
-    # Add grid
-    ax.grid(True, linestyle='--', alpha=0.7)
+    # Units, current value and change based on price; rows without history are masked out below
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nonzero = historical_prices != 0
+        units = np.where(nonzero, historical_values / historical_prices, 0)
+        absolute_changes = current - historical_prices
+        percent_changes = np.where(nonzero, absolute_changes / historical_prices * 100, 0)
+    current_values = current * units
     
-    # Show price labels
-    for i, row in df.iterrows():
-        ax.annotate(f"{currency_symbol}{row['price']:.2f}",  # Changed from 'value' to 'price'
-                   (row['date'], row['price']),  # Changed from 'value' to 'price'
-                   textcoords="offset points",
-                   xytext=(0,10), 
-                   ha='center')
+    missing = ~has_history
+    return pd.DataFrame({
+        'Ticker': tickers,
+        'Previous Date': [point['date'] if point else 'N/A' for point in points],
+        'Previous Price': historical_prices,
+        'Previous Value': historical_values,
+        'Current Price': current,
+        'Current Value': np.where(missing, np.nan, current_values),
+        'Change': np.where(missing, np.nan, absolute_changes),
+        'Change %': np.where(missing, np.nan, percent_changes)
+    })
+
+def plot_historical_data(ticker, historical_point, current_price, currency_symbol):
+    """Plot historical price data compared to current price"""
+    # Simple two-point line, rendered client-side instead of rasterizing a matplotlib figure
+    df = pd.DataFrame(
+        {'Price': [float(historical_point['price']), current_price]},
+        index=pd.DatetimeIndex([datetime.fromisoformat(historical_point['date']), datetime.now()])
+    )
     
-    # Show plot
-    st.pyplot(fig)
+    st.caption(f"{ticker} Price Comparison")
+    st.line_chart(df, x_label="Date", y_label=f"Price ({currency_symbol})")
 
 def create_sample_watch_list(watch_list_dir):
     """Create a sample watch list with just one historical data point from two years ago"""